@@ -1,12 +1,17 @@
+import asyncio
+import functools
+import html
 import logging
-import requests
-import re
+import httpx
+import orjson
 import os
+import time
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler
+from telegram.ext import (AIORateLimiter, Application, CommandHandler, ContextTypes, CallbackQueryHandler,
+                          InvalidCallbackData)
 
-# --- CONFIGURATION & SETUP (Unchanged) ---
+# --- CONFIGURATION & SETUP ---
 load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 SUI_PANEL_URL = os.getenv("SUI_PANEL_URL")
@@ -17,31 +22,92 @@ logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# Shared async HTTP client for the s-ui panel API (closed in post_shutdown)
+HTTP = httpx.AsyncClient(timeout=10, headers={'Accept': 'application/json', 'Token': SUI_API_TOKEN})
 
-# --- HELPER & API FUNCTIONS (Unchanged) ---
-def escape_markdown(text: str) -> str:
-    escape_chars = r'_*[]()~`>#+-=|{}.!'
-    return re.sub(f'([{re.escape(escape_chars)}])', r'\\\1', text)
+# Short-lived in-memory cache of the /apiv2/inbounds response
+INBOUNDS_CACHE_TTL = 30  # seconds
+# 'gen' is bumped on invalidation so a refresh started before it can't store stale data
+_inbounds_cache = {'t': 0.0, 'v': None, 'task': None, 'gen': 0}
 
+# Number of user buttons shown per page of an inbound's user list
+USERS_PAGE_SIZE = 20
 
-def get_sui_inbounds():
+
+# --- HELPER & API FUNCTIONS ---
+@functools.lru_cache(maxsize=4096)
+def _escape_cached(text: str) -> str:
+    """html.escape, memoized since tags and usernames repeat across refreshes and clicks."""
+    return html.escape(text)
+
+
+async def get_sui_inbounds():
     api_url = f"{SUI_PANEL_URL}/apiv2/inbounds"
-    headers = {'Accept': 'application/json', 'Token': SUI_API_TOKEN}
     try:
-        response = requests.get(api_url, headers=headers, timeout=10)
-        if response.ok:
-            data = response.json()
+        response = await HTTP.get(api_url)
+        if response.is_success:
+            data = orjson.loads(response.content)
             if data.get("success"):
                 return True, data.get("obj", {})
             else:
                 return False, f"API Error: {data.get('msg', 'Unknown API error')}"
         else:
             return False, f"HTTP Error: Status Code {response.status_code}"
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return False, f"Connection Error: {e}"
+    except orjson.JSONDecodeError as e:
+        return False, f"Invalid response: {e}"
+
+
+def _cached_inbounds():
+    if _inbounds_cache['v'] is not None and time.monotonic() - _inbounds_cache['t'] < INBOUNDS_CACHE_TTL:
+        return _inbounds_cache['v']
+    return None
+
+
+async def _refresh_inbounds(gen: int):
+    try:
+        is_successful, data = await get_sui_inbounds()
+        if not is_successful:
+            return False, data
+        inbound_list = data.get('inbounds', [])
+        cached = {'list': inbound_list, 'by_id': {inb.get('id'): inb for inb in inbound_list}}
+        if _inbounds_cache['gen'] == gen:
+            _inbounds_cache['t'] = time.monotonic()
+            _inbounds_cache['v'] = cached
+        return True, cached
+    finally:
+        if _inbounds_cache['gen'] == gen:
+            _inbounds_cache['task'] = None
+
 
+async def get_sui_inbounds_cached():
+    """Like get_sui_inbounds, but serves successful responses from memory for INBOUNDS_CACHE_TTL seconds.
 
-# --- TELEGRAM COMMAND HANDLERS (Unchanged, except for the button handler below) ---
+    On success the data is {'list': [inbound, ...], 'by_id': {inbound_id: inbound}}.
+    _render_inbounds memoizes its (text, markup) result on the same dict under 'rendered'.
+    Concurrent callers share a single in-flight panel request and get its result, success or failure.
+    """
+    cached = _cached_inbounds()
+    if cached is not None:
+        return True, cached
+    # No await between the check and create_task, so only one refresh task is ever started
+    task = _inbounds_cache['task']
+    if task is None:
+        task = _inbounds_cache['task'] = asyncio.create_task(_refresh_inbounds(_inbounds_cache['gen']))
+    # Shielded so one caller being cancelled doesn't cancel the fetch for everyone else
+    return await asyncio.shield(task)
+
+
+def invalidate_inbounds_cache() -> None:
+    """Drop the cached inbounds; call after any action that changes panel data (e.g. adding/deleting users)."""
+    _inbounds_cache['v'] = None
+    # Detach any in-flight refresh; the next caller starts a new one
+    _inbounds_cache['task'] = None
+    _inbounds_cache['gen'] += 1
+
+
+# --- TELEGRAM COMMAND HANDLERS ---
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     await update.message.reply_html(
@@ -52,34 +118,42 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     )
 
 
-async def list_inbounds_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    message = update.message or update.callback_query.message
-    await message.reply_text("Fetching inbounds from your panel...")
-    is_successful, data = get_sui_inbounds()
-    if not is_successful:
-        await message.reply_text(f"❌ Error: {escape_markdown(data)}")
-        return
-    inbound_list = data.get('inbounds', [])
-    if not inbound_list:
-        await message.reply_text("No inbounds found on your panel.")
-        return
+def _render_inbounds(cached) -> tuple[str, InlineKeyboardMarkup]:
+    """Builds the HTML inbound list text and its keyboard, memoized on the cache entry."""
+    if 'rendered' in cached:
+        return cached['rendered']
     keyboard = []
-    message_text = "*Available Inbounds:*\n"
-    for inbound in inbound_list:
-        remark = escape_markdown(inbound.get('tag', 'No Name'))
+    parts = ["<b>Available Inbounds:</b>\n"]
+    for inbound in cached['list']:
+        remark = inbound.get('tag', 'No Name')
         inbound_id = inbound.get('id', 0)
         user_count = len(inbound.get('users', []))
-        message_text += f"\n• *Name:* `{remark}` \\| *ID:* `{inbound_id}` \\| *Users:* {user_count}"
+        parts.append(f"• <b>Name:</b> <code>{_escape_cached(remark)}</code> | <b>ID:</b> <code>{inbound_id}</code> | "
+                     f"<b>Users:</b> {user_count}")
+        # Button labels are not parsed, so the raw tag is used here
         keyboard.append([
-            InlineKeyboardButton(f"View Users in '{inbound.get('tag', 'No Name')}' ({user_count})",
-                                 callback_data=f"view_users:{inbound_id}")
+            InlineKeyboardButton(f"View Users in '{remark}' ({user_count})",
+                                 callback_data=("view_users", inbound_id, 0))
         ])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    # Edit the message if it's from a button click, otherwise send a new one
-    if update.callback_query:
-        await update.callback_query.edit_message_text(message_text, reply_markup=reply_markup, parse_mode='MarkdownV2')
-    else:
-        await update.message.reply_text(message_text, reply_markup=reply_markup, parse_mode='MarkdownV2')
+    cached['rendered'] = ("\n".join(parts), InlineKeyboardMarkup(keyboard))
+    return cached['rendered']
+
+
+async def list_inbounds_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.message
+    # Send the ack while the panel request is in flight
+    _, (is_successful, data) = await asyncio.gather(
+        message.reply_text("Fetching inbounds from your panel..."),
+        get_sui_inbounds_cached(),
+    )
+    if not is_successful:
+        await message.reply_text(f"❌ Error: {data}")
+        return
+    if not data['list']:
+        await message.reply_text("No inbounds found on your panel.")
+        return
+    message_text, reply_markup = _render_inbounds(data)
+    await message.reply_text(message_text, reply_markup=reply_markup, parse_mode='HTML')
 
 
 # --- UPDATED BUTTON HANDLER ---
@@ -88,37 +162,39 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     query = update.callback_query
     await query.answer()
 
-    # Data can be "action:id" or "action:id:username"
-    parts = query.data.split(':', 2)
-    action = parts[0]
+    # Data is a tuple: (action,), (action, inbound_id, page) or (action, inbound_id, page, username)
+    action = query.data[0]
 
     # --- Action: view_users ---
     if action == "view_users":
-        inbound_id = int(parts[1])
-        is_successful, data = get_sui_inbounds()
+        _, inbound_id, page = query.data
+        is_successful, data = await get_sui_inbounds_cached()
         if not is_successful:
-            await query.edit_message_text(text=f"Error fetching data: {escape_markdown(data)}")
+            await query.edit_message_text(text=f"Error fetching data: {data}")
             return
 
-        target_inbound = next((inb for inb in data.get('inbounds', []) if inb.get('id') == inbound_id), None)
+        target_inbound = data['by_id'].get(inbound_id)
 
         if not target_inbound:
             await query.edit_message_text(text="Couldn't find that inbound. Try /list_inbounds again.")
             return
 
-        remark = escape_markdown(target_inbound.get('tag', 'No Name'))
+        remark = _escape_cached(target_inbound.get('tag', 'No Name'))
         user_list = target_inbound.get('users', [])
 
         if not user_list:
-            await query.edit_message_text(text=f"No users found in inbound *{remark}*\.", parse_mode='MarkdownV2')
+            await query.edit_message_text(text=f"No users found in inbound <b>{remark}</b>.", parse_mode='HTML')
             return
 
+        page_count = (len(user_list) + USERS_PAGE_SIZE - 1) // USERS_PAGE_SIZE
+        page = min(max(page, 0), page_count - 1)
+
         # --- CREATE USER BUTTONS ---
         user_keyboard = []
         # Arrange users into 2 columns for a cleaner look
         row = []
-        for user in user_list:
-            button = InlineKeyboardButton(user, callback_data=f"user_details:{inbound_id}:{user}")
+        for user in user_list[page * USERS_PAGE_SIZE:(page + 1) * USERS_PAGE_SIZE]:
+            button = InlineKeyboardButton(user, callback_data=("user_details", inbound_id, page, user))
             row.append(button)
             if len(row) == 2:
                 user_keyboard.append(row)
@@ -126,46 +202,94 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         if row:  # Add the last row if it's not full
             user_keyboard.append(row)
 
-        user_keyboard.append([InlineKeyboardButton("« Back to Inbounds", callback_data="back_to_inbounds")])
+        # Prev/Next buttons edit this same message to show the neighbouring page
+        nav_row = []
+        if page > 0:
+            nav_row.append(InlineKeyboardButton("« Prev", callback_data=("view_users", inbound_id, page - 1)))
+        if page < page_count - 1:
+            nav_row.append(InlineKeyboardButton("Next »", callback_data=("view_users", inbound_id, page + 1)))
+        if nav_row:
+            user_keyboard.append(nav_row)
+
+        user_keyboard.append([InlineKeyboardButton("« Back to Inbounds", callback_data=("back_to_inbounds",))])
         reply_markup = InlineKeyboardMarkup(user_keyboard)
-        await query.edit_message_text(text=f"Please select a user from *{remark}*:", reply_markup=reply_markup,
-                                      parse_mode='MarkdownV2')
+        page_info = f" (page {page + 1}/{page_count})" if page_count > 1 else ""
+        await query.edit_message_text(text=f"Please select a user from <b>{remark}</b>{page_info}:",
+                                      reply_markup=reply_markup, parse_mode='HTML')
 
     # --- Action: user_details (New) ---
     elif action == "user_details":
-        inbound_id = int(parts[1])
-        username = parts[2]
+        _, inbound_id, page, username = query.data
 
         # For now, just confirm the selection
-        message = f"You selected user `{escape_markdown(username)}` from inbound *{inbound_id}*\."
+        message = f"You selected user <code>{_escape_cached(username)}</code> from inbound <b>{inbound_id}</b>."
 
         keyboard = [
             # In the future, we can add buttons like "Get Stats" or "Delete"
-            [InlineKeyboardButton(f"« Back to User List", callback_data=f"view_users:{inbound_id}")]
+            [InlineKeyboardButton(f"« Back to User List", callback_data=("view_users", inbound_id, page))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(text=message, reply_markup=reply_markup, parse_mode='MarkdownV2')
+        await query.edit_message_text(text=message, reply_markup=reply_markup, parse_mode='HTML')
 
     # --- Action: back_to_inbounds ---
     elif action == "back_to_inbounds":
-        # Call the original command function to show the inbound list again
-        await list_inbounds_command(query, context)
+        # Edit the list back in place; no "Fetching..." ack for button navigation
+        is_successful, data = await get_sui_inbounds_cached()
+        if not is_successful:
+            await query.edit_message_text(text=f"Error fetching data: {data}")
+            return
+        if not data['list']:
+            await query.edit_message_text(text="No inbounds found on your panel.")
+            return
+        message_text, reply_markup = _render_inbounds(data)
+        await query.edit_message_text(message_text, reply_markup=reply_markup, parse_mode='HTML')
+
+
+async def invalid_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handles clicks on buttons whose callback data is no longer cached (e.g. after a restart)."""
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text(text="This menu has expired. Use /list_inbounds to start again.")
+
+
+async def post_shutdown(application: Application) -> None:
+    """Close the shared panel HTTP client."""
+    await HTTP.aclose()
 
 
 # --- MAIN BOT FUNCTION ---
 def main() -> None:
     """Start the bot."""
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        # Larger pool for outgoing Bot API calls, separate small pool for getUpdates
+        .connection_pool_size(32)
+        .pool_timeout(10.0)
+        .get_updates_connection_pool_size(4)
+        .get_updates_pool_timeout(10.0)
+        # Throttle and retry outgoing requests to stay under Telegram's flood limits
+        .rate_limiter(AIORateLimiter(overall_max_rate=28, overall_time_period=1,
+                                     group_max_rate=18, group_time_period=60, max_retries=3))
+        # Process updates as independent tasks so a slow panel call doesn't hold up other commands
+        .concurrent_updates(True)
+        # Keep callback data server-side so buttons can carry tuples instead of 64-byte strings
+        .arbitrary_callback_data(True)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("list_inbounds", list_inbounds_command))
 
     # Add the handler for all button clicks
+    application.add_handler(CallbackQueryHandler(invalid_button_handler, pattern=InvalidCallbackData))
     application.add_handler(CallbackQueryHandler(button_handler))
 
     logger.info("Bot is starting... Press Ctrl-C to stop.")
-    application.run_polling()
+    # Long-poll getUpdates so Telegram holds the connection open until updates arrive
+    application.run_polling(timeout=30, poll_interval=0, drop_pending_updates=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,251 @@
+import asyncio
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+import pytest
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+os.environ.setdefault("SUI_PANEL_URL", "http://panel.test")
+os.environ.setdefault("SUI_API_TOKEN", "test-token")
+
+import sub_bot  # noqa: E402
+
+INBOUNDS_PAYLOAD = {
+    "success": True,
+    "msg": "",
+    "obj": {
+        "inbounds": [
+            {"id": 1, "tag": "vless-main", "users": ["alice", "bob"]},
+            {"id": 7, "tag": "trojan_backup", "users": []},
+        ]
+    },
+}
+
+
+@pytest.fixture
+def panel(monkeypatch):
+    """Points sub_bot.HTTP at a mock panel; returns the list of requests it received."""
+    calls = []
+    response = {'status': 200, 'content': None, 'json': INBOUNDS_PAYLOAD}
+
+    def handler(request):
+        calls.append(request)
+        if response['content'] is not None:
+            return httpx.Response(response['status'], content=response['content'])
+        return httpx.Response(response['status'], json=response['json'])
+
+    monkeypatch.setattr(sub_bot, "HTTP", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    sub_bot.invalidate_inbounds_cache()
+    yield calls, response
+    sub_bot.invalidate_inbounds_cache()
+
+
+def test_cached_inbounds_from_panel_payload(panel):
+    calls, _ = panel
+    is_successful, data = asyncio.run(sub_bot.get_sui_inbounds_cached())
+
+    assert is_successful
+    assert [inb['id'] for inb in data['list']] == [1, 7]
+    assert data['by_id'][1]['tag'] == "vless-main"
+    assert data['by_id'][7]['users'] == []
+    assert len(calls) == 1
+
+
+def test_cached_inbounds_served_from_memory(panel):
+    calls, _ = panel
+
+    async def fetch_twice():
+        first = await sub_bot.get_sui_inbounds_cached()
+        second = await sub_bot.get_sui_inbounds_cached()
+        return first, second
+
+    first, second = asyncio.run(fetch_twice())
+
+    assert first == second
+    assert len(calls) == 1
+
+
+def test_non_json_response_is_reported(panel):
+    _, response = panel
+    response['content'] = b"<html><body>Please log in</body></html>"
+
+    is_successful, data = asyncio.run(sub_bot.get_sui_inbounds_cached())
+
+    assert not is_successful
+    assert data.startswith("Invalid response:")
+
+
+def test_concurrent_callers_share_one_request(panel):
+    calls, response = panel
+    response['status'] = 502
+
+    async def fetch_many():
+        return await asyncio.gather(*(sub_bot.get_sui_inbounds_cached() for _ in range(5)))
+
+    results = asyncio.run(fetch_many())
+
+    assert results == [(False, "HTTP Error: Status Code 502")] * 5
+    assert len(calls) == 1
+
+
+def test_invalidate_discards_in_flight_refresh(panel):
+    calls, response = panel
+
+    async def fetch_invalidate_fetch():
+        first = asyncio.ensure_future(sub_bot.get_sui_inbounds_cached())
+        await asyncio.sleep(0)  # let the first refresh start
+        response['json'] = {"success": True, "obj": {"inbounds": [{"id": 2, "tag": "new", "users": []}]}}
+        sub_bot.invalidate_inbounds_cache()
+        second = await sub_bot.get_sui_inbounds_cached()
+        await first
+        third = await sub_bot.get_sui_inbounds_cached()
+        return second, third
+
+    second, third = asyncio.run(fetch_invalidate_fetch())
+
+    assert list(second[1]['by_id']) == [2]
+    assert third == second
+    assert len(calls) == 2
+
+
+def test_list_inbounds_acks_then_lists(panel):
+    message = mock.Mock()
+    message.reply_text = mock.AsyncMock()
+
+    asyncio.run(sub_bot.list_inbounds_command(SimpleNamespace(message=message), None))
+
+    ack, listing = message.reply_text.await_args_list
+    assert ack.args == ("Fetching inbounds from your panel...",)
+    assert "vless-main" in listing.args[0]
+    assert listing.kwargs['parse_mode'] == 'HTML'
+
+
+BIG_INBOUND_PAYLOAD = {
+    "success": True,
+    "obj": {"inbounds": [{"id": 3, "tag": "big", "users": [f"user{i:02d}" for i in range(45)]}]},
+}
+
+
+def click(callback_data):
+    """Runs button_handler for a mocked CallbackQuery carrying callback_data and returns the query."""
+    query = mock.Mock(data=callback_data)
+    query.answer = mock.AsyncMock()
+    query.edit_message_text = mock.AsyncMock()
+    asyncio.run(sub_bot.button_handler(SimpleNamespace(callback_query=query), None))
+    query.answer.assert_awaited_once()
+    return query
+
+
+def keyboard_data(query):
+    """callback_data of every button in the edited message, row by row."""
+    markup = query.edit_message_text.await_args.kwargs['reply_markup']
+    return [[button.callback_data for button in row] for row in markup.inline_keyboard]
+
+
+def test_view_users_first_page(panel):
+    _, response = panel
+    response['json'] = BIG_INBOUND_PAYLOAD
+
+    query = click(("view_users", 3, 0))
+
+    rows = keyboard_data(query)
+    users = [data for row in rows[:-2] for data in row]
+    assert users == [("user_details", 3, 0, f"user{i:02d}") for i in range(20)]
+    assert rows[-2] == [("view_users", 3, 1)]
+    assert rows[-1] == [("back_to_inbounds",)]
+    assert "(page 1/3)" in query.edit_message_text.await_args.kwargs['text']
+
+
+def test_view_users_middle_page_has_prev_and_next(panel):
+    _, response = panel
+    response['json'] = BIG_INBOUND_PAYLOAD
+
+    rows = keyboard_data(click(("view_users", 3, 1)))
+
+    assert rows[0] == [("user_details", 3, 1, "user20"), ("user_details", 3, 1, "user21")]
+    assert rows[-2] == [("view_users", 3, 0), ("view_users", 3, 2)]
+
+
+def test_view_users_last_page(panel):
+    _, response = panel
+    response['json'] = BIG_INBOUND_PAYLOAD
+
+    query = click(("view_users", 3, 2))
+
+    rows = keyboard_data(query)
+    users = [data[3] for row in rows[:-2] for data in row]
+    assert users == [f"user{i:02d}" for i in range(40, 45)]
+    assert rows[-3] == [("user_details", 3, 2, "user44")]
+    assert rows[-2] == [("view_users", 3, 1)]
+    assert "(page 3/3)" in query.edit_message_text.await_args.kwargs['text']
+
+
+def test_view_users_out_of_range_page_is_clamped(panel):
+    _, response = panel
+    response['json'] = BIG_INBOUND_PAYLOAD
+
+    assert keyboard_data(click(("view_users", 3, 9))) == keyboard_data(click(("view_users", 3, 2)))
+    assert keyboard_data(click(("view_users", 3, -1))) == keyboard_data(click(("view_users", 3, 0)))
+
+
+def test_view_users_single_page_has_no_navigation(panel):
+    query = click(("view_users", 1, 0))
+
+    assert keyboard_data(query) == [
+        [("user_details", 1, 0, "alice"), ("user_details", 1, 0, "bob")],
+        [("back_to_inbounds",)],
+    ]
+    assert "page" not in query.edit_message_text.await_args.kwargs['text']
+
+
+def test_user_details_back_keeps_page(panel):
+    query = click(("user_details", 3, 2, "user42"))
+
+    assert keyboard_data(query) == [[("view_users", 3, 2)]]
+    assert "<code>user42</code>" in query.edit_message_text.await_args.kwargs['text']
+
+
+def test_render_inbounds_buttons_carry_tuples(panel):
+    is_successful, data = asyncio.run(sub_bot.get_sui_inbounds_cached())
+    assert is_successful
+
+    _, markup = sub_bot._render_inbounds(data)
+
+    assert [[button.callback_data for button in row] for row in markup.inline_keyboard] == [
+        [("view_users", 1, 0)],
+        [("view_users", 7, 0)],
+    ]
+
+
+def test_view_users_empty_inbound(panel):
+    query = click(("view_users", 7, 0))
+
+    assert query.edit_message_text.await_args.kwargs['text'] == "No users found in inbound <b>trojan_backup</b>."
+
+
+def test_view_users_unknown_inbound(panel):
+    query = click(("view_users", 99, 0))
+
+    assert "Couldn't find that inbound" in query.edit_message_text.await_args.kwargs['text']
+
+
+def test_back_to_inbounds_edits_list_in_place(panel):
+    query = click(("back_to_inbounds",))
+
+    args, kwargs = query.edit_message_text.await_args
+    assert "vless-main" in args[0]
+    assert kwargs['parse_mode'] == 'HTML'
+    assert keyboard_data(query) == [[("view_users", 1, 0)], [("view_users", 7, 0)]]
+
+
+def test_invalid_button_reports_expired_menu():
+    query = mock.Mock(data=sub_bot.InvalidCallbackData("stale"))
+    query.answer = mock.AsyncMock()
+    query.edit_message_text = mock.AsyncMock()
+
+    asyncio.run(sub_bot.invalid_button_handler(SimpleNamespace(callback_query=query), None))
+
+    query.answer.assert_awaited_once()
+    assert "expired" in query.edit_message_text.await_args.kwargs['text']